@@ -1,9 +1,10 @@
 import os
 import math
+import struct
 from geographiclib.geodesic import Geodesic
 
 from qgis.core import (
-    QgsPointXY, QgsGeometry, QgsField, QgsPropertyDefinition,
+    QgsGeometry, QgsField, QgsPropertyDefinition,
     QgsProject, QgsWkbTypes, QgsCoordinateTransform)
 
 from qgis.core import (
@@ -18,11 +19,68 @@ from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtCore import QVariant, QUrl
 
 from .settings import settings, epsg4326, geod
-from .utils import tr, conversionToMeters, makeIdlCrossingsPositive, DISTANCE_LABELS
+from .utils import tr, conversionToMeters, hasIdlCrossingLons, DISTANCE_LABELS
 
 SHAPE_TYPE = [tr("Polygon"), tr("Line")]
 
 
+def epicycloidVectors(r, k, sangle, cos_a, sin_a, cos_ka, sin_ka):
+    '''Return the azimuths and distances from the center to each epicycloid vertex
+
+    r is the radius of the rolling circle, k is the number of lobes plus one and
+    the trig tables are the cos and sin of a and k * a over the angle grid.'''
+    _atan2 = math.atan2
+    _sqrt = math.sqrt
+    _deg = math.degrees
+    rk = r * k
+    n = len(cos_a)
+    azimuths = [0.0] * n
+    distances = [0.0] * n
+    for i in range(n):
+        x = rk * cos_a[i] - r * cos_ka[i]
+        y = rk * sin_a[i] - r * sin_ka[i]
+        azimuths[i] = _deg(_atan2(y, x)) + sangle
+        distances[i] = _sqrt(x * x + y * y)
+    return(azimuths, distances)
+
+def geodesicDirectPoints(lat, lon, azimuths, distances):
+    '''Solve the geodesic direct problem from one origin for a list of azimuths
+    and distances. Return the lists of longitudes and latitudes.'''
+    # The private _GenDirect returns a tuple and skips building the result
+    # dict and normalizing the unused origin values that Direct does.
+    direct = geod._GenDirect
+    outmask = Geodesic.LATITUDE | Geodesic.LONGITUDE
+    n = len(azimuths)
+    lons = [0.0] * n
+    lats = [0.0] * n
+    for i in range(n):
+        g = direct(lat, lon, azimuths[i], False, distances[i], outmask)
+        lats[i] = g[1]
+        lons[i] = g[2]
+    return(lons, lats)
+
+def wkbFromLonLat(lons, lats, polygon):
+    '''Pack lists of longitudes and latitudes into little endian WKB. A polygon
+    is returned as a single closed ring, otherwise a line string.'''
+    n = len(lons)
+    close = polygon and (lons[0] != lons[-1] or lats[0] != lats[-1])
+    if close:
+        n += 1
+    # Interleave the coordinates with slice assignment rather than building pairs
+    coords = [0.0] * (2 * n)
+    if close:
+        coords[0:-2:2] = lons
+        coords[1:-2:2] = lats
+        coords[-2] = lons[0]
+        coords[-1] = lats[0]
+    else:
+        coords[0::2] = lons
+        coords[1::2] = lats
+    if polygon:
+        return(struct.pack('<BIII{}d'.format(2 * n), 1, QgsWkbTypes.Polygon, 1, n, *coords))
+    return(struct.pack('<BII{}d'.format(2 * n), 1, QgsWkbTypes.LineString, n, *coords))
+
+
 class CreateEpicycloidAlgorithm(QgsProcessingFeatureBasedAlgorithm):
     """
     Algorithm to create a epicycloid shape.
@@ -185,8 +243,25 @@ class CreateEpicycloidAlgorithm(QgsProcessingFeatureBasedAlgorithm):
         self.measureFactor = conversionToMeters(units)
         self.radius_converted = self.radius * self.measureFactor
         self.r2 = self.radius_converted / (self.lobes + 2.0)
+        self.r_dyn = self.lobes_dyn or self.radius_dyn
+        self.is_polygon = self.shape_type == 0
 
         self.step = 360.0 / segments
+        self.num_vertices = segments + 1
+        # The angle grid is the same for every feature so its trig tables
+        # are computed once. The last sample repeats the first so that a
+        # closed curve ends exactly where it starts.
+        angles = [math.radians(i * self.step) for i in range(segments)]
+        self.cos_a = [math.cos(a) for a in angles]
+        self.sin_a = [math.sin(a) for a in angles]
+        self.cos_a.append(self.cos_a[0])
+        self.sin_a.append(self.sin_a[0])
+        # Tables for the default number of lobes are kept, others are built as needed.
+        self.lobe_tables = self.lobeTrigTables(self.lobes)
+        self.static = not (self.start_angle_dyn or self.lobes_dyn or self.radius_dyn)
+        if self.static:
+            self.static_vectors = epicycloidVectors(
+                self.r2, self.lobes + 1.0, self.start_angle, self.cos_a, self.sin_a, *self.lobe_tables)
 
         source = self.parameterAsSource(parameters, 'INPUT', context)
         srcCRS = source.sourceCrs()
@@ -201,63 +276,75 @@ class CreateEpicycloidAlgorithm(QgsProcessingFeatureBasedAlgorithm):
         self.num_bad = 0
         return True
 
+    def lobeTrigTables(self, lobes):
+        '''Return the cos and sin tables of (lobes + 1) * angle for the angle grid'''
+        # (lobes + 1) is an integer so (lobes + 1) * angle falls back on the
+        # angle grid modulo 360 degrees and can be looked up in the base tables.
+        k = lobes + 1
+        segments = self.num_vertices - 1
+        idx = [(k * i) % segments for i in range(self.num_vertices)]
+        return(([self.cos_a[j] for j in idx], [self.sin_a[j] for j in idx]))
+
     def processFeature(self, feature, context, feedback):
         try:
-            if self.start_angle_dyn:
-                sangle, e = self.start_angle_property.valueAsDouble(context.expressionContext(), self.start_angle)
-                if not e:
-                    self.num_bad += 1
-                    return []
-            else:
-                sangle = self.start_angle
-            if self.lobes_dyn:
-                lobes2, e = self.lobes_property.valueAsInt(context.expressionContext(), self.lobes)
-                if not e or lobes2 < 1:
-                    self.num_bad += 1
-                    return []
-            else:
-                lobes2 = self.lobes
-            if self.radius_dyn:
-                radius2, e = self.radius_property.valueAsDouble(context.expressionContext(), self.radius)
-                if not e or radius2 <= 0:
-                    self.num_bad += 1
-                    return []
-                radius2 *= self.measureFactor
+            if self.static:
+                # The shape is identical for every feature, only its origin differs
+                azimuths, distances = self.static_vectors
             else:
-                radius2 = self.radius_converted
-            if self.lobes_dyn or self.radius_dyn:
-                r = radius2 / (lobes2 + 2.0)
-            else:
-                r = self.r2
+                if self.start_angle_dyn:
+                    sangle, e = self.start_angle_property.valueAsDouble(context.expressionContext(), self.start_angle)
+                    if not e:
+                        self.num_bad += 1
+                        return []
+                else:
+                    sangle = self.start_angle
+                if self.lobes_dyn:
+                    lobes2, e = self.lobes_property.valueAsInt(context.expressionContext(), self.lobes)
+                    if not e or lobes2 < 1:
+                        self.num_bad += 1
+                        return []
+                else:
+                    lobes2 = self.lobes
+                if self.radius_dyn:
+                    radius2, e = self.radius_property.valueAsDouble(context.expressionContext(), self.radius)
+                    if not e or radius2 <= 0:
+                        self.num_bad += 1
+                        return []
+                    radius2 *= self.measureFactor
+                else:
+                    radius2 = self.radius_converted
+                if self.r_dyn:
+                    r = radius2 / (lobes2 + 2.0)
+                else:
+                    r = self.r2
+                # Evaluate the whole parametric curve in one pass and only then
+                # solve the geodesic direct problem for each vertex.
+                if lobes2 == self.lobes:
+                    cos_ka, sin_ka = self.lobe_tables
+                else:
+                    cos_ka, sin_ka = self.lobeTrigTables(lobes2)
+                azimuths, distances = epicycloidVectors(
+                    r, lobes2 + 1.0, sangle, self.cos_a, self.sin_a, cos_ka, sin_ka)
 
-            pts = []
             pt = feature.geometry().asPoint()
             pt_orig_x = pt.x()
             pt_orig_y = pt.y()
             # make sure the coordinates are in EPSG:4326
             if self.geomTo4326:
-                pt = self.geomTo4326.transform(pt.x(), pt.y())
-            angle = 0.0
-            while angle <= 360.0:
-                a = math.radians(angle)
-                x = r * (lobes2 + 1.0) * math.cos(a) - r * math.cos((lobes2 + 1.0) * a)
-                y = r * (lobes2 + 1.0) * math.sin(a) - r * math.sin((lobes2 + 1.0) * a)
-                a2 = math.degrees(math.atan2(y, x)) + sangle
-                dist = math.sqrt(x * x + y * y)
-                g = geod.Direct(pt.y(), pt.x(), a2, dist, Geodesic.LATITUDE | Geodesic.LONGITUDE)
-                pts.append(QgsPointXY(g['lon2'], g['lat2']))
-                angle += self.step
-
-            makeIdlCrossingsPositive(pts)
-            # If the Output crs is not 4326 transform the points to the proper crs
-            if self.toSinkCrs:
-                for x, ptout in enumerate(pts):
-                    pts[x] = self.toSinkCrs.transform(ptout)
+                pt = self.geomTo4326.transform(pt_orig_x, pt_orig_y)
+            lons, lats = geodesicDirectPoints(pt.y(), pt.x(), azimuths, distances)
 
-            if self.shape_type == 0:
-                feature.setGeometry(QgsGeometry.fromPolygonXY([pts]))
-            else:
-                feature.setGeometry(QgsGeometry.fromPolylineXY(pts))
+            # Only a shape spanning more than 180 degrees of longitude can cross the IDL
+            if max(lons) - min(lons) > 180.0 and hasIdlCrossingLons(lons):
+                lons = [lon + 360.0 if lon < 0 else lon for lon in lons]
+
+            # Build the geometry directly from WKB rather than from QgsPointXY objects
+            geom = QgsGeometry()
+            geom.fromWkb(wkbFromLonLat(lons, lats, self.is_polygon))
+            # If the Output crs is not 4326 transform the whole geometry to the proper crs
+            if self.toSinkCrs:
+                geom.transform(self.toSinkCrs)
+            feature.setGeometry(geom)
             if self.export_geom:
                 attr = feature.attributes()
                 attr.append(pt_orig_x)
@@ -31,12 +31,17 @@ def conversionToMeters(units):
     return measureFactor
 
 def hasIdlCrossing(pts):
-    ptlen = len(pts)
+    return(hasIdlCrossingLons([pt.x() for pt in pts]))
+
+def hasIdlCrossingLons(lons):
+    '''Check a list of longitudes for a sign change of more than 180 degrees
+    from the first longitude'''
+    ptlen = len(lons)
     if(ptlen == 0):
         return(False)
-    x_last = pts[0].x()
+    x_last = lons[0]
     for i in range(1, ptlen):
-        x = pts[i].x()
+        x = lons[i]
         if (x_last < 0 and x >= 0):
             if (x - x_last) > 180:
                 return(True)